@@ -1,75 +1,324 @@
 #!/usr/bin/env python3
 # encoding=utf-8
 
-import argparse
+import asyncio
 import logging
+import random
 import signal
-from enum import Enum
-from os import getenv
+import sqlite3
+import sys
+from copy import deepcopy
+from functools import lru_cache
+from os import environ, getenv
 from pathlib import Path
-from time import sleep
-from typing import Dict, List
+from time import time
+from types import SimpleNamespace
+from typing import Dict, Iterable, Iterator, List, Literal, NoReturn, Optional, Sequence, TextIO
 
+import aiohttp
+import msgspec
+import orjson
 import yaml
-from openweather.weather import OpenWeather
-from prometheus_client import Gauge, start_http_server
-
-# Prometheus metrics
-TEMPERATURE = Gauge("owm_temperature", "The current Temperature", ["city", "country"])
-TEMPERATURE_MIN = Gauge(
-    "owm_temperature_min",
-    "Minimum temperature at the moment (within large megalopolises and urban areas)",
-    ["city", "country"],
-)
-TEMPERATURE_MAX = Gauge(
-    "owm_temperature_max",
-    "Maximum temperature at the moment (within large megalopolises and urban areas).",
-    ["city", "country"],
-)
-TEMPERATURE_FEEL = Gauge(
-    "owm_temperature_feel",
-    "Temperature. This temperature parameter accounts for the human perception of weather.",
-    ["city", "country"],
+from prometheus_client import start_http_server
+from prometheus_client.core import GaugeMetricFamily, Metric
+from prometheus_client.registry import REGISTRY, Collector
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
+
+OWM_WEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+# Temperature fields of the "main" response section, in the order they are unpacked
+TEMPERATURE_KEYS = ("temp", "temp_max", "temp_min", "feels_like")
+
+# Kelvin to target unit as (scale, offset) of an affine transform
+TEMPERATURE_SCALES = {"C": (1.0, -273.15), "F": (1.8, -459.67), "K": (1.0, 0.0)}
+
+# Attempts per request for transient API errors, the base delay between them,
+# and the upper bound for the poll delay after consecutive failed cycles
+RETRY_ATTEMPTS = 3
+RETRY_DELAY = 1
+MAX_BACKOFF = 3600
+
+# Handler and format shared by all loggers configured through configure_logging()
+LOG_HANDLER = logging.StreamHandler()
+LOG_HANDLER.setFormatter(
+    logging.Formatter(
+        "%(asctime)s - %(module)s:%(lineno)d - %(levelname)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
 )
-HUMIDITY = Gauge("owm_humidity", "Humidity, %", ["city", "country"])
-PRESSURE = Gauge("owm_pressure", "Atmospheric pressure on the sea level, hPa", ["city", "country"])
-WIND_DIRECTION = Gauge(
-    "owm_wind_direction",
-    "Wind direction, degrees (meteorological)",
-    ["city", "country"],
+
+USAGE = """usage: client.py [-h] [-c CONFIG_FILE] [-v]
+
+OpenWeatherMap Prometheus Exporter
+
+options:
+  -h, --help            show this help message and exit
+  -c, -f, --config-file, --config CONFIG_FILE
+                        Path to config file
+  -v, --verbose         Increase verbosity (can be used multiple times)"""
+
+# Long command line options, mapped to the short option they stand for
+LONG_OPTIONS = {"--config-file": "-c", "--config": "-c", "--verbose": "-v", "--help": "-h"}
+
+# Log level names accepted in the configuration
+LOG_LEVELS = {_name: getattr(logging, _name) for _name in ("NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")}
+
+# Log level per number of -v flags; more flags than entries select the last one
+VERBOSITY_LEVELS = (logging.NOTSET, logging.WARNING, logging.INFO, logging.DEBUG)
+
+# Environment variables overriding the configuration file, by setting name
+ENV_MAP = {
+    "interval": "INTERVAL",
+    "loglevel": "LOGLEVEL",
+    "listen_port": "LISTEN_PORT",
+    "api_key": "API_KEY",
+    "units": "UNITS",
+    "cache_file": "CACHE_FILE",
+    "cache_ttl": "CACHE_TTL",
+}
+
+# Set on shutdown; wakes the poll loop immediately instead of waiting out the interval
+STOP = asyncio.Event()
+
+# Prometheus metrics as (name, documentation), in the order of the values passed to WeatherCollector.update()
+METRICS = (
+    ("owm_temperature", "The current Temperature"),
+    ("owm_temperature_min", "Minimum temperature at the moment (within large megalopolises and urban areas)"),
+    ("owm_temperature_max", "Maximum temperature at the moment (within large megalopolises and urban areas)."),
+    ("owm_temperature_feel", "Temperature. This temperature parameter accounts for the human perception of weather."),
+    ("owm_humidity", "Humidity, %"),
+    ("owm_pressure", "Atmospheric pressure on the sea level, hPa"),
+    ("owm_wind_direction", "Wind direction, degrees (meteorological)"),
+    ("owm_wind_speed", "Wind Speed"),
+    ("owm_cloudiness", "Cloudiness, %"),
+    ("owm_sunrise_time", "Sunrise Time"),
+    ("owm_sunset_time", "Sunset Time"),
 )
-WIND_SPEED = Gauge("owm_wind_speed", "Wind Speed", ["city", "country"])
-CLOUDINESS = Gauge("owm_cloudiness", "Cloudiness, %", ["city", "country"])
-SUNRISE_TIME = Gauge("owm_sunrise_time", "Sunrise Time", ["city", "country"])
-SUNSET_TIME = Gauge("owm_sunset_time", "Sunset Time", ["city", "country"])
-WEATHER_CONDITION = Gauge("owm_weather_condition", "Weather Condition", ["city", "country", "condition"])
 
 
-class VerbosityLevel(Enum):
-    NOTSET = 0
-    WARNING = 1
-    INFO = 2
-    DEBUG = 3
+class WeatherCollector(Collector):
+    """Prometheus collector exporting the latest weather of every location.
+
+    Metric families are only built when scraped. An update replaces all values
+    of a location with a single dict assignment, so a scrape always sees a
+    consistent snapshot per location.
+    """
+
+    def __init__(self):
+        self._state: Dict[tuple[str, str], tuple[tuple[float, ...], str]] = {}
+
+    def update(self, city: str, country: str, values: Sequence[float], condition: str):
+        """Replace the metrics of a location.
+
+        Args:
+            city: City label
+            country: Country label
+            values: New values, in METRICS order
+            condition: Current weather condition description
+
+        Raises:
+            ValueError: If the number of values does not match METRICS.
+            TypeError: If a value is not numeric.
+        """
+        if len(values) != len(METRICS):
+            raise ValueError(f"Expected {len(METRICS)} values, got {len(values)}")
+        self._state[(city, country)] = (tuple(float(_value) for _value in values), condition)
+
+    def collect(self) -> Iterable[Metric]:
+        _state = list(self._state.items())
+
+        for _index, (_name, _documentation) in enumerate(METRICS):
+            _family = GaugeMetricFamily(_name, _documentation, labels=["city", "country"])
+            for _labels, (_values, _condition) in _state:
+                _family.add_metric(_labels, _values[_index])
+            yield _family
+
+        _family = GaugeMetricFamily(
+            "owm_weather_condition", "Weather Condition", labels=["city", "country", "condition"]
+        )
+        for (_city, _country), (_values, _condition) in _state:
+            _family.add_metric([_city, _country, _condition], 1)
+        yield _family
+
+
+COLLECTOR = WeatherCollector()
+REGISTRY.register(COLLECTOR)
+
+
+class WeatherAPIError(Exception):
+    """Raised when the API answers a request with an HTTP error status.
+
+    Unlike aiohttp's ClientResponseError, the message does not include the
+    request URL, which carries the API key.
+    """
+
+    def __init__(self, status: int, reason: str):
+        super().__init__(f"HTTP {status} {reason}")
+        self.status = status
+
+
+class WeatherRequestError(Exception):
+    """Raised when a request to the API fails without an HTTP error status.
+
+    Only the type of the underlying error is kept, since aiohttp includes the
+    request URL, and with it the API key, in some of its messages.
+    """
+
+    def __init__(self, error: BaseException):
+        super().__init__(type(error).__name__)
+
+
+class Location(msgspec.Struct, frozen=True):
+    """A location to export weather metrics for, by coordinates or by city name."""
+
+    name: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+
+class Settings(msgspec.Struct):
+    """Effective exporter settings after defaults, configuration and environment are merged."""
+
+    interval: int = 600
+    loglevel: str | int = "INFO"
+    listen_port: int = 9126
+    api_key: Optional[str] = None
+    units: Literal["C", "F", "K"] = "C"
+    locations: List[Location] = []
+    cache_file: Optional[str] = None
+    # OpenWeatherMap refreshes current weather about every 10 minutes; with a
+    # shorter interval, cycles within that window are answered from the cache
+    cache_ttl: int = 600
+
+
+class ResponseCache:
+    """Time-based cache for API responses, keyed by location.
+
+    When a path is given, entries are also written to an SQLite database so
+    that responses which are still fresh survive a restart of the exporter.
+
+    Args:
+        ttl: Seconds an entry stays valid
+        maxsize: Maximum number of entries kept at once
+        path: Optional SQLite database file for persisting entries
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024, path: Optional[str] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: Dict[str, tuple[float, Dict]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        # Database changes not yet flushed; None marks an evicted key
+        self._pending: Dict[str, Optional[tuple[float, Dict]]] = {}
+        if path:
+            self._db = sqlite3.connect(path)
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL NOT NULL, body BLOB NOT NULL);
+                CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires);
+                """
+            )
+            with self._db:
+                self._db.execute("DELETE FROM responses WHERE expires <= ?", (time(),))
+            _rows = self._db.execute(
+                "SELECT key, expires, body FROM responses ORDER BY expires DESC LIMIT ?", (maxsize,)
+            ).fetchall()
+            for _key, _expires, _body in reversed(_rows):
+                self._entries[_key] = (_expires, orjson.loads(_body))
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached response for key, or None if missing or expired."""
+        _entry = self._entries.get(key)
+        if _entry is None:
+            return None
+        if _entry[0] <= time():
+            del self._entries[key]
+            return None
+        return _entry[1]
+
+    def set(self, key: str, data: Dict):
+        """Store a response, evicting the oldest entry when the cache is full.
+
+        Only the in-memory entries are updated; the change reaches the database
+        on the next flush().
+        """
+        if key not in self._entries and len(self._entries) >= self.maxsize:
+            _evicted = next(iter(self._entries))
+            del self._entries[_evicted]
+            if self._db is not None:
+                self._pending[_evicted] = None
+        _expires = time() + self.ttl
+        self._entries[key] = (_expires, data)
+        if self._db is not None:
+            self._pending[key] = (_expires, data)
+
+    def flush(self):
+        """Write all changes made since the last flush to the database in one transaction.
+
+        Raises:
+            sqlite3.Error: If the write fails; the changes are kept for the next flush.
+        """
+        if self._db is None or not self._pending:
+            return
+        _deleted = [(_key,) for _key, _entry in self._pending.items() if _entry is None]
+        _stored = [
+            (_key, _entry[0], orjson.dumps(_entry[1])) for _key, _entry in self._pending.items() if _entry is not None
+        ]
+        with self._db:
+            self._db.executemany("DELETE FROM responses WHERE key = ?", _deleted)
+            self._db.executemany("INSERT OR REPLACE INTO responses (key, expires, body) VALUES (?, ?, ?)", _stored)
+        # Only forget the changes once they are committed, a failed write is retried on the next flush
+        self._pending.clear()
+
+    def close(self):
+        """Flush pending changes and close the backing database, if any."""
+        if self._db is not None:
+            try:
+                self.flush()
+            finally:
+                self._db.close()
+                self._db = None
+
+
+@lru_cache(maxsize=32)
+def load_yaml(_content: str) -> Optional[Dict]:
+    """Parse YAML content, reusing the result for identical content.
+
+    Callers must not modify the returned object; copy it first.
+    """
+    return yaml.load(_content, Loader=SafeLoader)
 
 
-def parse_config(_config_file: str = None) -> Dict:
+def parse_config(_source: str | Path | TextIO | None = None) -> Dict:
     """Parse the YAML configuration file.
 
     Args:
-        _config_file: Path to the configuration file. If None, uses default 'config.yaml'.
+        _source: Path to the configuration file, or an open text stream. If None, uses default 'config.yaml'.
 
     Returns:
-        Dict containing the configuration.
+        Dict containing the configuration, empty if the file doesn't exist.
 
     Raises:
-        FileNotFoundError: If the config file doesn't exist.
-        yaml.YAMLError: If the YAML file is invalid.
+        SystemExit: If the YAML content is invalid.
     """
-    if _config_file is None:
-        _config_file = Path(__file__).parent / "config.yaml"
+    if _source is None:
+        _source = Path(__file__).parent / "config.yaml"
     try:
-        with open(_config_file, "r", encoding="utf-8") as _f:
-            _config = yaml.safe_load(_f)
+        if hasattr(_source, "read"):
+            _content = _source.read()
+        else:
+            with open(_source, "r", encoding="utf-8") as _f:
+                _content = _f.read()
+        _config = deepcopy(load_yaml(_content))
     except FileNotFoundError:
         return {}
     except yaml.YAMLError as _error:
@@ -82,75 +331,312 @@ def parse_config(_config_file: str = None) -> Dict:
         return _config
 
 
-def parse_args() -> argparse.Namespace:
+def load_settings(_config: Optional[Dict], _overrides: Optional[Dict] = None) -> Settings:
+    """Merge defaults, configuration file, overrides and environment into Settings.
+
+    Later sources win: configuration file, then overrides (e.g. command line),
+    then environment variables from ENV_MAP. Unknown configuration keys are ignored,
+    string values from the environment are coerced to the declared field types.
+
+    Args:
+        _config: Parsed configuration file
+        _overrides: Additional settings taking precedence over the configuration file
+
+    Returns:
+        Settings instance.
+
+    Raises:
+        msgspec.ValidationError: If a setting has an invalid type.
+    """
+    _env = {_key: environ[_name] for _key, _name in ENV_MAP.items() if _name in environ}
+    return msgspec.convert({**(_config or {}), **(_overrides or {}), **_env}, Settings, strict=False)
+
+
+def exit_with_usage(_message: str) -> NoReturn:
+    """Print the usage and an error message to stderr and exit like argparse does."""
+    print(USAGE.partition("\n")[0], file=sys.stderr)
+    print(f"{Path(sys.argv[0]).name}: error: {_message}", file=sys.stderr)
+    sys.exit(2)
+
+
+def next_option_value(_option: str, _argv: Iterator[str]) -> str:
+    """Take the value of an option from the next command line argument.
+
+    Exits like argparse if there is none or it looks like another option.
+    """
+    _value = next(_argv, None)
+    if _value is None or (_value.startswith("-") and _value != "-"):
+        exit_with_usage(f"argument {_option}: expected one argument")
+    return _value
+
+
+def parse_args(_argv: Optional[Sequence[str]] = None) -> SimpleNamespace:
     """Parse command line arguments.
 
+    Long options may be abbreviated to any unambiguous prefix and take their
+    value either as the next argument or after "=". Short options can be
+    combined (-vv) and -c/-f take the rest of the argument as value (-cPATH or
+    -c=PATH).
+
+    Args:
+        _argv: Arguments to parse. If None, uses sys.argv[1:].
+
     Returns:
         Namespace containing the parsed arguments.
     """
-    parser = argparse.ArgumentParser(description="OpenWeatherMap Prometheus Exporter")
-    parser.add_argument("-c", "--config-file", dest="config_file", type=str, help="Path to config file")
-    parser.add_argument(
-        "-v",
-        "--verbose",
-        dest="verbosity",
-        action="count",
-        default=0,
-        help="Increase verbosity (can be used multiple times)",
-    )
+    _args = SimpleNamespace(config_file=None, verbosity=0)
+    _argv = iter(sys.argv[1:] if _argv is None else _argv)
+    for _arg in _argv:
+        if _arg.startswith("--") and len(_arg) > 2:
+            _name, _has_value, _value = _arg.partition("=")
+            _matches = sorted(_option for _option in LONG_OPTIONS if _option.startswith(_name))
+            if _name in LONG_OPTIONS:
+                _short = LONG_OPTIONS[_name]
+            elif len({LONG_OPTIONS[_option] for _option in _matches}) == 1:
+                _short = LONG_OPTIONS[_matches[0]]
+            elif _matches:
+                exit_with_usage(f"ambiguous option: {_name} could match {', '.join(_matches)}")
+            else:
+                exit_with_usage(f"unrecognized arguments: {_arg}")
+
+            if _short == "-c":
+                _args.config_file = _value if _has_value else next_option_value(_name, _argv)
+            elif _has_value:
+                exit_with_usage(f"argument {_name}: ignored explicit argument '{_value}'")
+            elif _short == "-v":
+                _args.verbosity += 1
+            else:
+                print(USAGE)
+                sys.exit(0)
+        elif _arg.startswith("-") and len(_arg) > 1 and _arg != "--":
+            for _index, _flag in enumerate(_arg[1:], start=2):
+                if _flag == "v":
+                    _args.verbosity += 1
+                elif _flag == "h":
+                    print(USAGE)
+                    sys.exit(0)
+                elif _flag in ("c", "f"):
+                    if _index == 2 and _arg[2:3] == "=":
+                        # Like argparse, only an option leading its argument takes -c=PATH
+                        _args.config_file = _arg[3:]
+                    else:
+                        _args.config_file = _arg[_index:] or next_option_value(f"-{_flag}", _argv)
+                    break
+                else:
+                    exit_with_usage(f"unrecognized arguments: {_arg}")
+        else:
+            exit_with_usage(f"unrecognized arguments: {_arg}")
 
-    return parser.parse_args()
+    return _args
 
 
-def configure_logging(_logger: logging.Logger, _level: str = "INFO") -> logging.Logger:
+def configure_logging(_logger: logging.Logger, _level: str | int = "INFO") -> logging.Logger:
     """Configure logging level and format.
 
+    The shared LOG_HANDLER is attached on first use; later calls only adjust
+    the level.
+
     Args:
         _logger: Existing logger instance
-        _level: Logging level from configuration
+        _level: Logging level from configuration, by name or as logging constant
 
     Returns:
         Configured logger instance
-    """
-    if not _logger.handlers:
-        _fmt = logging.Formatter(
-            "%(asctime)s - %(module)s:%(lineno)d - %(levelname)s: %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S",
-        )
-
-        _ch = logging.StreamHandler()
-        _ch.setFormatter(_fmt)
 
-        _logger.addHandler(_ch)
+    Raises:
+        ValueError: If the level name is unknown.
+    """
+    if LOG_HANDLER not in _logger.handlers:
+        _logger.addHandler(LOG_HANDLER)
+    if isinstance(_level, str):
+        try:
+            _level = LOG_LEVELS[_level.upper()]
+        except KeyError:
+            raise ValueError(f"Unknown log level: {_level}") from None
+    if _logger.level != _level:
         _logger.setLevel(_level)
-        _logger.info(f"Setting loglevel to {_level}")
+        _logger.info(f"Setting loglevel to {logging.getLevelName(_level)}")
 
     return _logger
 
 
 def shutdown(_signal):
     """Signal handler to gracefully shut down the application."""
-    global RUNNING
-    RUNNING = False
+    STOP.set()
 
 
-def main(_api: OpenWeather, _units: str, _locations: List[Dict[str, any]], _log: logging.Logger):
-    _data = {}
-    while RUNNING:
+def convert_temperatures(_kelvins: List[float], _unit: str) -> List[float]:
+    """Convert a batch of temperatures reported by OpenWeatherMap to the configured unit.
+
+    Args:
+        _kelvins: Temperatures in Kelvin
+        _unit: Target unit, one of "C", "F" or "K"
+
+    Returns:
+        Converted temperatures, in input order
+    """
+    _scale, _offset = TEMPERATURE_SCALES[_unit]
+    return [_kelvin * _scale + _offset for _kelvin in _kelvins]
+
+
+def cache_key(_location: Location) -> str:
+    """Build the response cache key for a location.
+
+    Coordinates are rounded to roughly 1 km so that nearby entries share a
+    response; locations without coordinates are keyed by their lowercased name.
+    """
+    if _location.lat is not None and _location.lon is not None:
+        return f"{_location.lat:.2f},{_location.lon:.2f}"
+    return _location.name.lower()
+
+
+def is_transient(_error: BaseException) -> bool:
+    """Check whether a failed request is worth retrying.
+
+    Rate limiting and server errors are retried, other HTTP errors (e.g. an
+    invalid API key or unknown city) are not.
+    """
+    if isinstance(_error, aiohttp.ClientResponseError):
+        return _error.status == 429 or _error.status >= 500
+    return isinstance(_error, (aiohttp.ClientError, TimeoutError))
+
+
+def backoff_delay(_interval: float, _failures: int) -> float:
+    """Compute the wait before the next poll cycle.
+
+    Args:
+        _interval: Configured poll interval in seconds
+        _failures: Number of consecutive poll cycles in which every request failed
+
+    Returns:
+        The interval itself without failures, otherwise an exponentially growing
+        delay with up to 10% jitter, capped at MAX_BACKOFF but never shorter than
+        the interval.
+    """
+    if not _failures:
+        return _interval
+    return max(_interval, min(_interval * 2**_failures, MAX_BACKOFF)) + random.uniform(0, _interval * 0.1)
+
+
+def request_params(_api_key: str, _location: Location) -> Dict[str, str | float]:
+    """Build the API query parameters for a location.
+
+    Args:
+        _api_key: OpenWeatherMap API key
+        _location: Location entry from the configuration
+
+    Returns:
+        Dict of query parameters, by coordinates if available, otherwise by city name.
+    """
+    if _location.lat is not None and _location.lon is not None:
+        return {"appid": _api_key, "lat": _location.lat, "lon": _location.lon}
+    return {"appid": _api_key, "q": _location.name}
+
+
+async def fetch_one(_session: aiohttp.ClientSession, _params: Dict[str, str | float]) -> Dict:
+    """Fetch the current weather for a single location.
+
+    Args:
+        _session: Shared HTTP session
+        _params: Query parameters from request_params()
+
+    Returns:
+        Dict containing the decoded API response.
+
+    Raises:
+        WeatherAPIError: If the API answers with an HTTP error status.
+        WeatherRequestError: If the request fails otherwise, e.g. on a timeout.
+    """
+    for _attempt in range(RETRY_ATTEMPTS):
+        try:
+            async with _session.get(OWM_WEATHER_URL, params=_params) as _response:
+                _response.raise_for_status()
+                return orjson.loads(await _response.read())
+        except (aiohttp.ClientError, TimeoutError) as _error:
+            if _attempt == RETRY_ATTEMPTS - 1 or not is_transient(_error):
+                if isinstance(_error, aiohttp.ClientResponseError):
+                    raise WeatherAPIError(_error.status, _error.message) from None
+                raise WeatherRequestError(_error) from None
+            await asyncio.sleep(min(RETRY_DELAY * 2**_attempt, 10))
+
+
+async def fetch_cached(
+    _session: aiohttp.ClientSession, _params: Dict[str, str | float], _key: str, _cache: ResponseCache
+) -> Dict:
+    """Fetch the current weather for a location unless a fresh response is cached under key."""
+    _data = _cache.get(_key)
+    if _data is None:
+        _data = await fetch_one(_session, _params)
+        _cache.set(_key, _data)
+    return _data
+
+
+def create_session() -> aiohttp.ClientSession:
+    """Create the HTTP session shared by all poll cycles.
+
+    Connections and DNS lookups are pooled so that the requests of one cycle,
+    and their retries, share TLS connections to the API. Both expire well
+    before the default interval, so each cycle normally starts with a fresh
+    lookup and handshake. Must be called from within a running event loop.
+
+    Returns:
+        Configured client session
+    """
+    _connector = aiohttp.TCPConnector(limit=100, limit_per_host=20, keepalive_timeout=75, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=_connector, timeout=aiohttp.ClientTimeout(total=30))
+
+
+async def run(_settings: Settings, _cache: ResponseCache, _log: logging.Logger):
+    """Open the shared HTTP session and run the poll loop until shutdown."""
+    if getenv("TERM", None):
+        _loop = asyncio.get_running_loop()
+        for _signal in (signal.SIGTERM, signal.SIGINT):
+            _loop.add_signal_handler(_signal, shutdown, _signal)
+
+    async with create_session() as _session:
+        await main(_session, _settings, _cache, _log)
+
+
+async def main(_session: aiohttp.ClientSession, _settings: Settings, _cache: ResponseCache, _log: logging.Logger):
+    _named_locations = []
+    for _location in _settings.locations:
+        if not _location.name:
+            _log.warning("Skipping location without name: %s", _location)
+            continue
+        _named_locations.append(_location)
+
+    # Everything that only depends on the configuration is resolved once, as
+    # parallel lists indexed like _named_locations
+    _cities = [_location.name for _location in _named_locations]
+    _keys = [cache_key(_location) for _location in _named_locations]
+
+    # Locations sharing a cache key are requested only once per cycle
+    _requests = {_key: request_params(_settings.api_key, _location) for _key, _location in zip(_keys, _named_locations)}
+
+    _failures = 0
+    while not STOP.is_set():
+        # Skip per-location debug logging entirely unless it is going to be emitted
+        _debug = _log.isEnabledFor(logging.DEBUG)
         try:
-            for _location in _locations:
-                _city = _location.get("name")
-                if not _city:
-                    _log.warning(f"Skipping location without name: {_location}")
+            # Fetch weather data for all locations concurrently
+            _responses = await asyncio.gather(
+                *(fetch_cached(_session, _query, _key, _cache) for _key, _query in _requests.items()),
+                return_exceptions=True,
+            )
+            _by_key = dict(zip(_requests, _responses))
+            _results = [_by_key[_key] for _key in _keys]
+
+            if _results and all(isinstance(_data, BaseException) for _data in _results):
+                _failures += 1
+            else:
+                _failures = 0
+
+            for _city, _data in zip(_cities, _results):
+                if isinstance(_data, BaseException):
+                    _log.error("Error fetching location %s: %s: %s", _city, type(_data).__name__, _data)
                     continue
 
                 try:
-                    # Fetch weather data
-                    if _location.get("lat") is not None and _location.get("lon") is not None:
-                        _data = _api.get_weather(lat=_location["lat"], lon=_location["lon"])
-                    else:
-                        _data = _api.get_weather(city=_city)
-
                     # Extract and validate main weather data
                     _main_data = _data.get("main", {})
                     _sys_data = _data.get("sys", {})
@@ -159,89 +645,93 @@ def main(_api: OpenWeather, _units: str, _locations: List[Dict[str, any]], _log:
                     _weather_data = _data.get("weather", [{}])[0]
 
                     # Process temperature data
-                    if _units != "K":
-                        _current_temperature = _api.convert_temperature(_main_data.get("temp"), to_unit=_units)
-                        _max_temperature = _api.convert_temperature(_main_data.get("temp_max"), to_unit=_units)
-                        _min_temperature = _api.convert_temperature(_main_data.get("temp_min"), to_unit=_units)
-                        _felt_temperature = _api.convert_temperature(_main_data.get("feels_like"), to_unit=_units)
-                    else:
-                        _current_temperature = _main_data.get("temp")
-                        _max_temperature = _main_data.get("temp_max")
-                        _min_temperature = _main_data.get("temp_min")
-                        _felt_temperature = _main_data.get("feels_like")
+                    _current_temperature, _max_temperature, _min_temperature, _felt_temperature = convert_temperatures(
+                        [_main_data.get(_key) for _key in TEMPERATURE_KEYS], _settings.units
+                    )
 
                     # Update metrics
                     _country = _sys_data.get("country", "unknown")
 
-                    TEMPERATURE.labels(_city, _country).set(_current_temperature)
-                    TEMPERATURE_MIN.labels(_city, _country).set(_min_temperature)
-                    TEMPERATURE_MAX.labels(_city, _country).set(_max_temperature)
-                    TEMPERATURE_FEEL.labels(_city, _country).set(_felt_temperature)
-                    HUMIDITY.labels(_city, _country).set(_main_data.get("humidity", 0))
-                    PRESSURE.labels(_city, _country).set(_main_data.get("pressure", 0))
-                    WIND_DIRECTION.labels(_city, _country).set(_wind_data.get("deg", 0))
-                    WIND_SPEED.labels(_city, _country).set(_wind_data.get("speed", 0))
-                    CLOUDINESS.labels(_city, _country).set(_clouds_data.get("all", 0))
-                    SUNRISE_TIME.labels(_city, _country).set(_sys_data.get("sunrise", 0))
-                    SUNSET_TIME.labels(_city, _country).set(_sys_data.get("sunset", 0))
-                    WEATHER_CONDITION.labels(_city, _country, _weather_data.get("description", "unknown")).set(1)
-
-                    _log.debug(f"Updated metrics for {_city}, {_country}")
-                    _log.debug(_data)
+                    COLLECTOR.update(
+                        _city,
+                        _country,
+                        (
+                            _current_temperature,
+                            _min_temperature,
+                            _max_temperature,
+                            _felt_temperature,
+                            _main_data.get("humidity", 0),
+                            _main_data.get("pressure", 0),
+                            _wind_data.get("deg", 0),
+                            _wind_data.get("speed", 0),
+                            _clouds_data.get("all", 0),
+                            _sys_data.get("sunrise", 0),
+                            _sys_data.get("sunset", 0),
+                        ),
+                        _weather_data.get("description", "unknown"),
+                    )
+
+                    if _debug:
+                        _log.debug("Updated metrics for %s, %s", _city, _country)
+                        _log.debug(_data)
                 except Exception as _loc_error:
-                    _log.error(f"Error processing location {_city}: {_loc_error}")
-                    _log.debug(_data)
+                    _log.error("Error processing location %s: %s", _city, _loc_error)
+                    if _debug:
+                        _log.debug(_data)
                     continue
 
+            # Persist this cycle's fresh responses in a single transaction. The
+            # cache is optional, so a failing database must not fail the cycle.
+            try:
+                _cache.flush()
+            except sqlite3.Error as _db_error:
+                _log.warning("Could not persist response cache: %s", _db_error)
+
         except Exception as _error:
-            _log.error(f"Error in main loop: {_error}")
-        finally:
-            sleep(interval)
+            _log.error("Error in main loop: %s", _error)
+            _failures += 1
+
+        _delay = backoff_delay(_settings.interval, _failures)
+        if _failures:
+            _log.warning("Poll cycle failed %d time(s) in a row, next attempt in %.0fs", _failures, _delay)
+
+        try:
+            await asyncio.wait_for(STOP.wait(), timeout=_delay)
+        except TimeoutError:
+            continue
 
 
 if __name__ == "__main__":
-    RUNNING = True
-    api_key = None
     args = parse_args()
     config = parse_config(args.config_file)
 
     try:
-        if getenv("TERM", None):
-            # noinspection PyTypeChecker
-            signal.signal(signal.SIGTERM, shutdown)
-            # noinspection PyTypeChecker
-            signal.signal(signal.SIGINT, shutdown)
-
         # Configuration with defaults and environment overrides
-        interval: int = int(getenv("INTERVAL", config.get("interval", "600")))
-        log_level: str = getenv(
-            "LOGLEVEL", VerbosityLevel(args.verbosity).name if args.verbosity > 0 else config.get("loglevel", "INFO")
-        )
-        listen_port: int = int(getenv("LISTEN_PORT", config.get("listen_port", "9126")))
-        api_key: str | None = getenv("API_KEY", config.get("api_key"))
-        units: str = getenv("UNITS", config.get("units", "C"))
-        locations: list = config.get("locations", [])
+        overrides = {}
+        if args.verbosity > 0:
+            overrides["loglevel"] = VERBOSITY_LEVELS[min(args.verbosity, len(VERBOSITY_LEVELS) - 1)]
+        settings = load_settings(config, overrides)
 
-        if not api_key:
+        if not settings.api_key:
             raise ValueError("API key is required")
-        if not locations:
+        if not settings.locations:
             raise ValueError("No locations specified in configuration")
 
         # Initialize logging
         logger = logging.getLogger(__name__)
-        log = configure_logging(logger, log_level)
+        log = configure_logging(logger, settings.loglevel)
 
-        start_http_server(listen_port)
-        log.info(f"Exporter started on port {listen_port}")
+        start_http_server(settings.listen_port)
+        log.info(f"Exporter started on port {settings.listen_port}")
 
-        api = OpenWeather(api_key)
-
-        main(api, units, locations, log)
+        cache = ResponseCache(ttl=settings.cache_ttl, path=settings.cache_file)
+        try:
+            asyncio.run(run(settings, cache, log), loop_factory=uvloop.new_event_loop if uvloop else None)
+        finally:
+            cache.close()
 
     except KeyboardInterrupt:
         print("Received interrupt signal, shutting down...")
     except Exception as error:
         print(f"Fatal error: {error}")
         raise
-    finally:
-        RUNNING = False
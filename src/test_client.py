@@ -1,12 +1,48 @@
+import asyncio
+import io
 import logging
 import signal
+import sqlite3
+import tempfile
 import unittest
-from unittest.mock import mock_open, patch
+from pathlib import Path
+from unittest.mock import patch
 
-from client import configure_logging, parse_args, parse_config, shutdown
+import aiohttp
+import msgspec
+import yaml
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from client import (
+    MAX_BACKOFF,
+    RETRY_ATTEMPTS,
+    Location,
+    ResponseCache,
+    Settings,
+    WeatherAPIError,
+    WeatherCollector,
+    backoff_delay,
+    cache_key,
+    configure_logging,
+    fetch_one,
+    convert_temperatures,
+    load_settings,
+    load_yaml,
+    main,
+    parse_args,
+    parse_config,
+    request_params,
+    run,
+    shutdown,
+)
 
 
 class TestClient(unittest.TestCase):
+    VALID_CONFIG = "interval: 600\nloglevel: INFO\nlisten_port: 9126"
+    LOCATIONS_CONFIG = "api_key: test_key\nlocations:\n  - name: Berlin\n    lat: 52.52\n    lon: 13.41"
+    MINIMAL_CONFIG = "api_key: null\nlocations: []"
+
     def setUp(self):
         """Set up test fixtures."""
         self.logger = logging.getLogger("test_logger")
@@ -17,14 +53,13 @@ class TestClient(unittest.TestCase):
         """Clean up after tests."""
         # Clean up logging handlers
         logging.getLogger("test_logger").handlers = []
-        # Reset running state
+        # Reset shutdown state
         import client
 
-        client.RUNNING = True
+        client.STOP.clear()
 
-    @patch("builtins.open", new_callable=mock_open, read_data="interval: 600\nloglevel: INFO\nlisten_port: 9126")
-    def test_parse_config_valid(self, mock_file):
-        config = parse_config(mock_file)
+    def test_parse_config_valid(self):
+        config = parse_config(io.StringIO(self.VALID_CONFIG))
         self.assertIsInstance(config, dict)
         self.assertEqual(config["interval"], 600)
         self.assertEqual(config["loglevel"], "INFO")
@@ -42,6 +77,38 @@ class TestClient(unittest.TestCase):
             self.assertIsNone(args.config_file)
             self.assertEqual(args.verbosity, 0)
 
+    def test_parse_args_combined_flags(self):
+        args = parse_args(["--config-file=/etc/owm.yaml", "-vv", "--verbose"])
+        self.assertEqual(args.config_file, "/etc/owm.yaml")
+        self.assertEqual(args.verbosity, 3)
+
+    def test_parse_args_config_spellings(self):
+        for argv in (
+            ["--config", "x.yaml"],
+            ["--config=x.yaml"],
+            ["--conf", "x.yaml"],
+            ["-cx.yaml"],
+            ["-c=x.yaml"],
+            ["-f=x.yaml"],
+            ["-f", "x.yaml"],
+            ["-vfx.yaml"],
+        ):
+            with self.subTest(argv=argv):
+                self.assertEqual(parse_args(argv).config_file, "x.yaml")
+
+    def test_parse_args_verbose_prefix(self):
+        self.assertEqual(parse_args(["--verb", "--v"]).verbosity, 2)
+
+    def test_parse_args_invalid(self):
+        with patch("sys.stderr"):
+            with self.assertRaises(SystemExit) as context:
+                parse_args(["--unknown"])
+            self.assertEqual(context.exception.code, 2)
+            for argv in (["-c"], ["-c", "-v"], ["--config", "--verbose"], ["--verbose=1"], ["-x"]):
+                with self.subTest(argv=argv), self.assertRaises(SystemExit) as context:
+                    parse_args(argv)
+                self.assertEqual(context.exception.code, 2)
+
     def test_set_logger(self):
         custom_logger = logging.getLogger("test_logger")
         log = configure_logging(custom_logger, "INFO")
@@ -53,20 +120,35 @@ class TestClient(unittest.TestCase):
         log = configure_logging(logger, "INFO")
         self.assertEqual(log.level, logging.INFO)
 
+    def test_set_logging_level_name(self):
+        logger = logging.getLogger("test_logger")
+        self.assertEqual(configure_logging(logger, "warning").level, logging.WARNING)
+        with self.assertRaises(ValueError):
+            configure_logging(logger, "VERBOSE")
+
+    def test_reconfigure_logging(self):
+        logger = logging.getLogger("test_logger")
+        configure_logging(logger, "INFO")
+        configure_logging(logger, "DEBUG")
+        self.assertEqual(logger.level, logging.DEBUG)
+        self.assertEqual(len(logger.handlers), 1)
+
     def test_shutdown(self):
         import client
 
-        client.RUNNING = True
+        client.STOP.clear()
         shutdown(signal.SIGTERM)
-        self.assertFalse(client.RUNNING)
-
-    @patch(
-        "builtins.open",
-        new_callable=mock_open,
-        read_data="api_key: test_key\nlocations:\n  - name: Berlin\n    lat: 52.52\n    lon: 13.41",
-    )
-    def test_parse_config_with_locations(self, mock_file):
-        config = parse_config(mock_file)
+        self.assertTrue(client.STOP.is_set())
+
+    @unittest.skipUnless(yaml.__with_libyaml__, "PyYAML built without libyaml")
+    @patch("client.yaml.load", wraps=yaml.load)
+    def test_parse_config_uses_libyaml(self, mock_load):
+        load_yaml.cache_clear()
+        parse_config(io.StringIO("interval: 600"))
+        self.assertIs(mock_load.call_args.kwargs["Loader"], yaml.CSafeLoader)
+
+    def test_parse_config_with_locations(self):
+        config = parse_config(io.StringIO(self.LOCATIONS_CONFIG))
         self.assertIsInstance(config, dict)
         self.assertEqual(config["api_key"], "test_key")
         self.assertIsInstance(config["locations"], list)
@@ -75,13 +157,366 @@ class TestClient(unittest.TestCase):
         self.assertEqual(config["locations"][0]["lat"], 52.52)
         self.assertEqual(config["locations"][0]["lon"], 13.41)
 
-    @patch("builtins.open", new_callable=mock_open, read_data="api_key: null\nlocations: []")
-    def test_parse_config_minimal(self, mock_file):
-        config = parse_config(mock_file)
+    def test_parse_config_cached(self):
+        first = parse_config(io.StringIO(self.VALID_CONFIG))
+        first["interval"] = 0
+        second = parse_config(io.StringIO(self.VALID_CONFIG))
+        self.assertEqual(second["interval"], 600)
+        self.assertIsNot(first, second)
+
+    def test_parse_config_minimal(self):
+        config = parse_config(io.StringIO(self.MINIMAL_CONFIG))
         self.assertIsInstance(config, dict)
         self.assertIsNone(config["api_key"])
         self.assertEqual(config["locations"], [])
 
+    def test_parse_config_from_path(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "config.yaml"
+            path.write_text(self.VALID_CONFIG, encoding="utf-8")
+            self.assertEqual(parse_config(str(path))["interval"], 600)
+            self.assertEqual(parse_config(Path(tmp) / "missing.yaml"), {})
+
+    def test_convert_temperatures(self):
+        for unit, expected in (("C", [0.0, 100.0]), ("F", [32.0, 212.0]), ("K", [273.15, 373.15])):
+            with self.subTest(unit=unit):
+                converted = convert_temperatures([273.15, 373.15], unit)
+                self.assertEqual(len(converted), 2)
+                for value, target in zip(converted, expected):
+                    self.assertAlmostEqual(value, target)
+
+    def test_cache_key(self):
+        self.assertEqual(cache_key(Location(name="Berlin", lat=52.5201, lon=13.4049)), "52.52,13.40")
+        self.assertEqual(cache_key(Location(name="Berlin")), "berlin")
+
+    def test_request_params(self):
+        self.assertEqual(
+            request_params("key", Location(name="Berlin", lat=52.52, lon=13.41)),
+            {"appid": "key", "lat": 52.52, "lon": 13.41},
+        )
+        self.assertEqual(request_params("key", Location(name="Berlin")), {"appid": "key", "q": "Berlin"})
+
+    def test_response_cache(self):
+        cache = ResponseCache(ttl=60, maxsize=1)
+        cache.set("berlin", {"main": {}})
+        self.assertEqual(cache.get("berlin"), {"main": {}})
+        cache.set("paris", {"main": {}})
+        self.assertIsNone(cache.get("berlin"))
+
+    def test_response_cache_persistent(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "weather_cache.sqlite")
+            cache = ResponseCache(ttl=60, path=path)
+            cache.set("berlin", {"main": {"temp": 280.0}})
+            cache.close()
+
+            cache = ResponseCache(ttl=60, path=path)
+            self.assertEqual(cache.get("berlin"), {"main": {"temp": 280.0}})
+            cache.close()
+
+    def test_response_cache_writes_on_flush(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "weather_cache.sqlite")
+            cache = ResponseCache(ttl=60, maxsize=1, path=path)
+            cache.set("berlin", {"main": {"temp": 280.0}})
+            cache.set("paris", {"main": {"temp": 285.0}})
+            unflushed = ResponseCache(ttl=60, path=path)
+            self.assertIsNone(unflushed.get("paris"))
+            unflushed.close()
+
+            cache.flush()
+            reopened = ResponseCache(ttl=60, path=path)
+            self.assertIsNone(reopened.get("berlin"))
+            self.assertEqual(reopened.get("paris"), {"main": {"temp": 285.0}})
+            reopened.close()
+            cache.close()
+
+    def test_response_cache_keeps_failed_writes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "weather_cache.sqlite")
+            cache = ResponseCache(ttl=60, path=path)
+            cache.set("berlin", {"main": {"temp": 280.0}})
+            with sqlite3.connect(path) as db:
+                db.execute("DROP TABLE responses")
+            with self.assertRaises(sqlite3.Error):
+                cache.flush()
+
+            # Reopening recreates the table, the next flush writes the kept entry
+            ResponseCache(ttl=60, path=path).close()
+            cache.flush()
+            reopened = ResponseCache(ttl=60, path=path)
+            self.assertEqual(reopened.get("berlin"), {"main": {"temp": 280.0}})
+            reopened.close()
+            cache.close()
+
+    def test_response_cache_expired(self):
+        cache = ResponseCache(ttl=0)
+        cache.set("berlin", {"main": {}})
+        self.assertIsNone(cache.get("berlin"))
+
+    def test_backoff_delay(self):
+        self.assertEqual(backoff_delay(600, 0), 600)
+        self.assertGreaterEqual(backoff_delay(600, 1), 1200)
+        self.assertLessEqual(backoff_delay(600, 1), 1260)
+        self.assertLessEqual(backoff_delay(600, 10), MAX_BACKOFF + 60)
+        self.assertGreaterEqual(backoff_delay(7200, 3), 7200)
+
+    def test_weather_collector(self):
+        collector = WeatherCollector()
+        collector.update("Berlin", "DE", (10.0, 9.0, 11.0, 8.5, 80, 1013, 270, 3.5, 75, 1700000000, 1700030000), "rain")
+        families = {family.name: family for family in collector.collect()}
+        self.assertEqual(families["owm_temperature"].samples[0].labels, {"city": "Berlin", "country": "DE"})
+        self.assertEqual(families["owm_temperature"].samples[0].value, 10.0)
+        self.assertEqual(families["owm_sunset_time"].samples[0].value, 1700030000)
+        self.assertEqual(families["owm_weather_condition"].samples[0].labels["condition"], "rain")
+
+        collector.update("Berlin", "DE", (10.0, 9.0, 11.0, 8.5, 80, 1013, 270, 3.5, 75, 1700000000, 1700030000), "snow")
+        families = {family.name: family for family in collector.collect()}
+        self.assertEqual(len(families["owm_weather_condition"].samples), 1)
+
+    def test_weather_collector_invalid_values(self):
+        collector = WeatherCollector()
+        with self.assertRaises(ValueError):
+            collector.update("Berlin", "DE", (10.0,), "rain")
+        with self.assertRaises(TypeError):
+            collector.update("Berlin", "DE", (None,) * 11, "rain")
+        self.assertEqual(list(collector.collect())[0].samples, [])
+
+    def test_load_settings_defaults(self):
+        with patch.dict("os.environ", {}, clear=True):
+            settings = load_settings({})
+        self.assertEqual(settings.interval, 600)
+        self.assertEqual(settings.loglevel, "INFO")
+        self.assertEqual(settings.listen_port, 9126)
+        self.assertIsNone(settings.api_key)
+        self.assertEqual(settings.units, "C")
+        self.assertEqual(settings.locations, [])
+
+    def test_load_settings_precedence(self):
+        config = {"interval": 300, "loglevel": "WARNING", "units": "F", "unknown": True}
+        with patch.dict("os.environ", {"INTERVAL": "120", "LISTEN_PORT": "9999"}, clear=True):
+            settings = load_settings(config, {"loglevel": "DEBUG"})
+        self.assertEqual(settings.interval, 120)
+        self.assertEqual(settings.listen_port, 9999)
+        self.assertEqual(settings.loglevel, "DEBUG")
+        self.assertEqual(settings.units, "F")
+
+    def test_load_settings_invalid_units(self):
+        with patch.dict("os.environ", {"UNITS": "X"}, clear=True):
+            with self.assertRaises(msgspec.ValidationError):
+                load_settings({})
+
+    def test_load_settings_locations(self):
+        config = {"locations": [{"name": "Berlin", "lat": 52.52, "lon": 13.41}, {"name": "Paris"}]}
+        with patch.dict("os.environ", {}, clear=True):
+            settings = load_settings(config)
+        self.assertEqual(settings.locations, [Location("Berlin", 52.52, 13.41), Location("Paris")])
+
+
+WEATHER = {
+    "main": {
+        "temp": 283.15,
+        "temp_min": 282.15,
+        "temp_max": 284.15,
+        "feels_like": 281.15,
+        "humidity": 80,
+        "pressure": 1013,
+    },
+    "wind": {"speed": 3.5, "deg": 270},
+    "clouds": {"all": 75},
+    "sys": {"country": "DE", "sunrise": 1700000000, "sunset": 1700030000},
+    "weather": [{"description": "light rain"}],
+}
+
+
+class CycleLimit:
+    """Stand-in for client.STOP that ends the poll loop after a number of cycles without waiting."""
+
+    def __init__(self, cycles):
+        self.cycles = cycles
+
+    def is_set(self):
+        self.cycles -= 1
+        return self.cycles < 0
+
+    async def wait(self):
+        return True
+
+
+class TestPolling(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """Start a local stand-in for the OpenWeatherMap API."""
+        self.requests = []
+        self.statuses = {}
+        self.delays = {}
+        app = web.Application()
+        app.router.add_get("/weather", self.handle_weather)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.session = aiohttp.ClientSession()
+
+        self.collector = WeatherCollector()
+        for target, value in (
+            ("client.OWM_WEATHER_URL", str(self.server.make_url("/weather"))),
+            ("client.COLLECTOR", self.collector),
+            ("client.STOP", asyncio.Event()),
+            ("client.RETRY_DELAY", 0),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.log = logging.getLogger("test_polling")
+        self.cache = ResponseCache(ttl=600)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.server.close()
+
+    async def handle_weather(self, request):
+        self.requests.append(dict(request.query))
+        await asyncio.sleep(self.delays.get(request.query.get("q"), 0))
+        status = self.statuses.get(request.query.get("q"), 200)
+        if isinstance(status, list):
+            # One status per request, answering normally once they are used up
+            status = status.pop(0) if status else 200
+        if status != 200:
+            return web.Response(status=status)
+        return web.json_response(WEATHER)
+
+    async def run_cycles(self, settings, cycles):
+        with patch("client.STOP", CycleLimit(cycles)):
+            await main(self.session, settings, self.cache, self.log)
+
+    async def test_main_updates_metrics(self):
+        settings = Settings(api_key="secret", locations=[Location("Berlin", 52.52, 13.41)])
+        await self.run_cycles(settings, 1)
+
+        self.assertEqual(self.requests, [{"appid": "secret", "lat": "52.52", "lon": "13.41"}])
+        families = {family.name: family for family in self.collector.collect()}
+        self.assertAlmostEqual(families["owm_temperature"].samples[0].value, 10.0)
+        self.assertEqual(families["owm_temperature"].samples[0].labels, {"city": "Berlin", "country": "DE"})
+        self.assertEqual(families["owm_weather_condition"].samples[0].labels["condition"], "light rain")
+
+    async def test_main_fetches_shared_location_once(self):
+        settings = Settings(
+            api_key="secret", locations=[Location("Berlin", 52.52, 13.41), Location("Mitte", 52.52, 13.41)]
+        )
+        await self.run_cycles(settings, 2)
+
+        self.assertEqual(len(self.requests), 1)
+        families = {family.name: family for family in self.collector.collect()}
+        self.assertEqual({sample.labels["city"] for sample in families["owm_temperature"].samples}, {"Berlin", "Mitte"})
+
+    async def test_main_refetches_expired_responses(self):
+        self.cache = ResponseCache(ttl=0)
+        settings = Settings(
+            api_key="secret", locations=[Location("Berlin", 52.52, 13.41), Location("Mitte", 52.52, 13.41)]
+        )
+        await self.run_cycles(settings, 2)
+
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_main_does_not_log_api_key(self):
+        self.statuses["Nowhere"] = 401
+        settings = Settings(api_key="secret", locations=[Location("Nowhere")])
+        with self.assertLogs("test_polling", level="ERROR") as logs:
+            await self.run_cycles(settings, 1)
+
+        self.assertIn("401", logs.output[0])
+        self.assertNotIn("secret", "\n".join(logs.output))
+
+        # With a single pooled connection held by a slow request, the other
+        # one runs into the connect timeout, whose message includes the URL
+        await self.session.close()
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=1), timeout=aiohttp.ClientTimeout(connect=0.05)
+        )
+        self.delays["Busy"] = 0.5
+        settings = Settings(api_key="secret", locations=[Location("Busy"), Location("Nowhere")])
+        with self.assertLogs("test_polling", level="ERROR") as logs:
+            await self.run_cycles(settings, 1)
+
+        self.assertIn("ConnectionTimeoutError", logs.output[0])
+        self.assertNotIn("secret", "\n".join(logs.output))
+
+    async def test_main_survives_failing_cache_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "weather_cache.sqlite")
+            self.cache = ResponseCache(ttl=0, path=path)
+            with sqlite3.connect(path) as db:
+                db.execute("DROP TABLE responses")
+
+            settings = Settings(api_key="secret", locations=[Location("Berlin", 52.52, 13.41)])
+            with patch("client.backoff_delay", wraps=backoff_delay) as delay, self.assertLogs("test_polling") as logs:
+                await self.run_cycles(settings, 2)
+            with self.assertRaises(sqlite3.Error):
+                self.cache.close()
+
+        self.assertIn("Could not persist response cache", logs.output[0])
+        self.assertEqual([call.args[1] for call in delay.call_args_list], [0, 0])
+        families = {family.name: family for family in self.collector.collect()}
+        self.assertAlmostEqual(families["owm_temperature"].samples[0].value, 10.0)
+
+    async def test_fetch_one_retries_transient_errors(self):
+        for status in (503, 429):
+            with self.subTest(status=status):
+                self.requests.clear()
+                self.statuses["Berlin"] = status
+                with self.assertRaises(WeatherAPIError) as error:
+                    await fetch_one(self.session, {"appid": "secret", "q": "Berlin"})
+
+                self.assertEqual(error.exception.status, status)
+                self.assertEqual(len(self.requests), RETRY_ATTEMPTS)
+
+    async def test_fetch_one_recovers_after_retry(self):
+        self.statuses["Berlin"] = [503]
+        self.assertEqual(await fetch_one(self.session, {"appid": "secret", "q": "Berlin"}), WEATHER)
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_fetch_one_does_not_retry_client_errors(self):
+        self.statuses["Berlin"] = 401
+        with self.assertRaises(WeatherAPIError) as error:
+            await fetch_one(self.session, {"appid": "secret", "q": "Berlin"})
+
+        self.assertEqual(error.exception.status, 401)
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_main_counts_only_fully_failed_cycles(self):
+        self.cache = ResponseCache(ttl=0)
+        self.statuses["Berlin"] = [401, 401, 200, 401]
+        self.statuses["Paris"] = [401, 401, 401, 401]
+        settings = Settings(api_key="secret", locations=[Location("Berlin"), Location("Paris")])
+        with patch("client.backoff_delay", wraps=backoff_delay) as delay, self.assertLogs("test_polling", "ERROR"):
+            await self.run_cycles(settings, 4)
+
+        self.assertEqual([call.args[1] for call in delay.call_args_list], [1, 2, 0, 1])
+
+    async def test_shutdown_wakes_main(self):
+        settings = Settings(interval=3600, api_key="secret", locations=[Location("Berlin", 52.52, 13.41)])
+        task = asyncio.create_task(main(self.session, settings, self.cache, self.log))
+        while not self.requests:
+            await asyncio.sleep(0.01)
+
+        shutdown(signal.SIGTERM)
+        await asyncio.wait_for(task, timeout=1)
+
+    async def test_run_closes_session_on_shutdown(self):
+        sessions = []
+
+        def create_session():
+            sessions.append(aiohttp.ClientSession())
+            return sessions[-1]
+
+        shutdown(signal.SIGTERM)
+        settings = Settings(api_key="secret", locations=[Location("Berlin", 52.52, 13.41)])
+        with patch("client.create_session", create_session), patch("client.getenv", return_value=None):
+            await asyncio.wait_for(run(settings, self.cache, self.log), timeout=1)
+
+        self.assertEqual(len(sessions), 1)
+        self.assertTrue(sessions[0].closed)
+        self.assertEqual(self.requests, [])
+
 
 if __name__ == "__main__":
     unittest.main()